@@ -1,6 +1,90 @@
 import socket
 import sys
 
+# Seconds to wait for the server to respond to a transaction
+RESPONSE_TIMEOUT = 30.0
+
+# Seconds to wait for the server to finish closing the connection
+CLOSE_TIMEOUT = 5.0
+
+class TollClient:
+    """
+    A persistent TCP connection to the toll server.
+
+    Any number of transactions can be sent over the same connection, avoiding a
+    new TCP handshake per transaction. Messages and responses are each
+    terminated by a newline. If the server has closed the connection in the
+    meantime (e.g. because it was idle), it is reopened before the next send.
+    """
+
+    def __init__(self, server_host, server_port):
+        self.address = (server_host, server_port)
+        self.connect()
+
+    def connect(self):
+        """Opens a new connection to the server."""
+        self.sock = socket.create_connection(self.address, timeout=RESPONSE_TIMEOUT)
+        # Disable Nagle's algorithm so the short message is sent immediately
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.pending = b""
+
+    def server_closed(self):
+        """Checks, without blocking, whether the server has closed or reset the connection."""
+        self.sock.setblocking(False)
+        try:
+            return self.sock.recv(1, socket.MSG_PEEK) == b""
+        except BlockingIOError:
+            return False  # Nothing to read; the connection is still open
+        except OSError:
+            return True
+        finally:
+            self.sock.settimeout(RESPONSE_TIMEOUT)
+
+    def send(self, transaction_type, plate, toll_point):
+        """
+        Sends a transaction message and returns the server's response.
+
+        Message format: "TYPE,plate,toll_point"
+        Example: "ENTRY,ABC123,3" or "EXIT,ABC123,10"
+        """
+        if self.server_closed():
+            self.sock.close()
+            self.connect()
+        # The server only accepts the transaction type in uppercase
+        self.sock.sendall(f"{transaction_type.upper()},{plate},{toll_point}\n".encode())
+
+        # Read until a complete newline-terminated response is available
+        while b"\n" not in self.pending:
+            chunk = self.sock.recv(1024)
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            self.pending += chunk
+        response, _, self.pending = self.pending.partition(b"\n")
+        return response.decode()
+
+    def close(self):
+        """
+        Closes the connection with a half-close: the client's FIN is sent first and
+        the server's FIN is awaited before the socket is released. The server only
+        closes after reading the end of the stream (or resets a connection that
+        was idle too long), so it does not accumulate TIME_WAIT sockets.
+        """
+        try:
+            self.sock.shutdown(socket.SHUT_WR)
+            self.sock.settimeout(CLOSE_TIMEOUT)
+            while self.sock.recv(1024):
+                pass
+        except OSError:
+            pass
+        finally:
+            self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
 def send_transaction(server_host, server_port, transaction_type, plate, toll_point):
     """
     Connects to the server, sends the transaction message, and prints the server's response.
@@ -8,16 +92,9 @@ def send_transaction(server_host, server_port, transaction_type, plate, toll_poi
     Message format: "TYPE,plate,toll_point"
     Example: "ENTRY,ABC123,3" or "EXIT,ABC123,10"
     """
-    message = f"{transaction_type},{plate},{toll_point}"
-    
     try:
-        # Create a TCP socket connection
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((server_host, server_port))
-            s.sendall(message.encode())
-            
-            # Wait for a response from the server (up to 1024 bytes)
-            response = s.recv(1024).decode()
+        with TollClient(server_host, server_port) as client:
+            response = client.send(transaction_type, plate, toll_point)
             print("Server response:", response)
     except Exception as e:
         print("Error communicating with the server:", e)
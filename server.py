@@ -1,14 +1,64 @@
+import os
 import socket
-import multiprocessing
-import time
+import selectors
+import signal
+import threading
 import logging
+import logging.handlers
+import queue
+import struct
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # Define a fixed toll fee rate per unit distance (here, per toll point difference)
 RATE = 1.0
 
+# Maximum number of client connections handled concurrently; further clients
+# wait in the listen backlog until a worker is free
+MAX_WORKERS = 64
+
+# Seconds a client connection may stay idle before the server closes it, so idle
+# booths give their worker back to the pool
+IDLE_TIMEOUT = 300.0
+
+# Size of the per-connection receive buffer; a single message must fit in it
+RECV_BUFFER_SIZE = 256
+
+# Number of independently locked partitions of the highway state.
+# Transactions for plates in different shards never contend for the same lock.
+SHARDS = 16
+
+# Pre-encoded response pieces, so replies are assembled from bytes instead of
+# formatting and encoding a new string for every transaction
+INVALID_FORMAT_RESPONSE = b"ERROR: Invalid message format\n"
+INVALID_POINT_RESPONSE = b"ERROR: Invalid toll point\n"
+UNKNOWN_TYPE_RESPONSE = b"ERROR: Unknown transaction type\n"
+VEHICLE_PREFIX = b"Vehicle "
+VEHICLE_ERROR_PREFIX = b"ERROR: Vehicle "
+ENTERED_MID = b" entered at point "
+EXITED_MID = b" exited at point "
+FEE_MID = b". Fee: "
+ALREADY_IN_HIGHWAY_SUFFIX = b" already in highway\n"
+NOT_IN_HIGHWAY_SUFFIX = b" not found in highway\n"
+
+# Periodic highway statistics line logged by stats_display
+STATS_TEMPLATE = ("Current vehicles in highway: %d | "
+                  "Total vehicles used highway: %d | "
+                  "Total fees collected: %.2f")
+
+# socket.sendmsg() is not available on every platform (e.g. Windows)
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
 def setup_logging():
-    """Configure logging to log to both console and a file."""
+    """
+    Configure logging to log to both console and a file.
+    Must be called exactly once, from main, before any worker threads start.
+
+    Records are placed on an in-memory queue and written out by a background
+    listener thread, so client handlers never block on console or disk I/O.
+    Returns the started QueueListener, which must be stopped on shutdown to
+    flush any pending records.
+    """
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
     
@@ -24,106 +74,190 @@ def setup_logging():
     ch.setLevel(logging.INFO)
     ch.setFormatter(formatter)
     
-    # Avoid duplicate handlers if already configured
-    if not logger.handlers:
-        logger.addHandler(fh)
-        logger.addHandler(ch)
-    else:
-        logger.handlers.clear()
-        logger.addHandler(fh)
-        logger.addHandler(ch)
+    # The listener thread drains the queue into the file and console handlers
+    log_queue = queue.Queue(-1)
+    qh = logging.handlers.QueueHandler(log_queue)
+    listener = logging.handlers.QueueListener(log_queue, fh, ch)
+    listener.start()
+    
+    logger.addHandler(qh)
+    
+    return listener
+
+def send_response(conn, *buffers):
+    """
+    Send a single newline-terminated response, given as one or more bytes
+    pieces, to the client.
+    Where supported, the pieces are handed to the kernel in one scatter-gather
+    sendmsg() call instead of being concatenated first.
+    """
+    if not HAS_SENDMSG:
+        conn.sendall(b"".join(buffers))
+        return
+    buffers = list(buffers)
+    while buffers:
+        sent = conn.sendmsg(buffers)
+        # Drop the pieces that were fully sent and trim a partially sent one
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers.pop(0))
+        if sent:
+            buffers[0] = buffers[0][sent:]
 
-def handle_client(conn, address, vehicles, total_vehicles, total_fees, lock):
+def process_message(conn, address, data, vehicles, locks, current_vehicles, total_vehicles, total_fees):
     """
-    Handle a single client (toll booth) connection.
+    Process a single transaction message from a client and send the response.
+    The message is parsed as raw ASCII bytes, and the plate is kept as bytes for
+    the shard dictionaries and responses.
     Message format: "TYPE,plate,point"
     Where TYPE is either "ENTRY" or "EXIT", plate is the vehicle plate number,
     and point is the toll booth number.
+
+    The highway state is split into SHARDS partitions; only the shard owning
+    the plate (and its lock) is touched by a transaction.
+    """
+    parts = data.split(b',')
+    if len(parts) != 3:
+        send_response(conn, INVALID_FORMAT_RESPONSE)
+        logging.error(f"From {address}: ERROR: Invalid message format")
+        return
+
+    transaction_type, plate, point_str = parts
+    try:
+        point = int(point_str)  # int() accepts ASCII digits in bytes directly
+    except ValueError:
+        send_response(conn, INVALID_POINT_RESPONSE)
+        logging.error(f"From {address}: ERROR: Invalid toll point")
+        return
+
+    idx = hash(plate) % SHARDS
+    shard = vehicles[idx]
+    plate_name = plate.decode(errors='replace')  # Only needed for log messages
+
+    # The shard lock only covers the shard and counter updates; responses and
+    # logging happen after it is released
+    if transaction_type == b"ENTRY":
+        with locks[idx]:
+            already_in_highway = plate in shard
+            if not already_in_highway:
+                shard[plate] = point
+                current_vehicles[idx] += 1
+        if already_in_highway:
+            send_response(conn, VEHICLE_ERROR_PREFIX, plate, ALREADY_IN_HIGHWAY_SUFFIX)
+            logging.error(f"CLIENT ENTRY ERROR: Plate {plate_name} attempted re-entry at toll point {point}.")
+            return
+        send_response(conn, VEHICLE_PREFIX, plate, ENTERED_MID, b"%d\n" % point)
+        logging.info(f"CLIENT ENTRY: Plate {plate_name} entered at toll point {point}.")
+    
+    elif transaction_type == b"EXIT":
+        with locks[idx]:
+            entry_point = shard.pop(plate, None)
+            if entry_point is not None:
+                fee = abs(point - entry_point) * RATE
+                current_vehicles[idx] -= 1
+                total_fees[idx] += fee
+                total_vehicles[idx] += 1
+        if entry_point is None:
+            send_response(conn, VEHICLE_ERROR_PREFIX, plate, NOT_IN_HIGHWAY_SUFFIX)
+            logging.error(f"CLIENT EXIT ERROR: Plate {plate_name} not found when attempting exit at toll point {point}.")
+            return
+        send_response(conn, VEHICLE_PREFIX, plate, EXITED_MID, b"%d" % point, FEE_MID, b"%a\n" % fee)  # %a keeps the float's str() text
+        logging.info(f"CLIENT EXIT: Plate {plate_name} exited at toll point {point} with fee collected {fee}.")
+    
+    else:
+        send_response(conn, UNKNOWN_TYPE_RESPONSE)
+        logging.error(f"From {address}: ERROR: Unknown transaction type")
+
+def handle_client(conn, address, vehicles, locks, current_vehicles, total_vehicles, total_fees):
+    """
+    Handle a client (toll booth) connection.
+    The connection is kept open until the client closes it or stays idle for
+    IDLE_TIMEOUT seconds, so a booth can send any number of newline-terminated
+    messages over it. Each message receives a newline-terminated response.
+
+    Data is received into one fixed-size buffer reused for the whole connection,
+    so no new bytes object is allocated per recv. A message that does not fit in
+    the buffer is rejected, and the rest of it is discarded up to its newline.
     """
-    setup_logging()  # Ensure logging is configured in this child process
     with conn:
+        # Disable Nagle's algorithm so the short reply is sent immediately
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.settimeout(IDLE_TIMEOUT)
+        buf = bytearray(RECV_BUFFER_SIZE)
+        view = memoryview(buf)
+        filled = 0
+        discarding = False  # Skipping the remainder of an oversized message
         try:
-            data = conn.recv(1024).decode().strip()
-            if not data:
-                return
-            parts = data.split(',')
-            if len(parts) != 3:
-                error_msg = "ERROR: Invalid message format"
-                conn.sendall(error_msg.encode())
-                logging.error(f"From {address}: {error_msg}")
-                return
-
-            transaction_type, plate, point_str = parts
-            try:
-                point = int(point_str)
-            except ValueError:
-                error_msg = "ERROR: Invalid toll point"
-                conn.sendall(error_msg.encode())
-                logging.error(f"From {address}: {error_msg}")
-                return
-
-            if transaction_type.upper() == "ENTRY":
-                with lock:
-                    if plate in vehicles:
-                        response = f"ERROR: Vehicle {plate} already in highway"
-                        conn.sendall(response.encode())
-                        logging.error(f"CLIENT ENTRY ERROR: Plate {plate} attempted re-entry at toll point {point}.")
-                        return
-                    else:
-                        vehicles[plate] = point
-                        response = f"Vehicle {plate} entered at point {point}"
-                conn.sendall(response.encode())
-                logging.info(f"CLIENT ENTRY: Plate {plate} entered at toll point {point}.")
-            
-            elif transaction_type.upper() == "EXIT":
-                with lock:
-                    if plate not in vehicles:
-                        response = f"ERROR: Vehicle {plate} not found in highway"
-                        conn.sendall(response.encode())
-                        logging.error(f"CLIENT EXIT ERROR: Plate {plate} not found when attempting exit at toll point {point}.")
-                        return
-                    else:
-                        entry_point = vehicles.pop(plate)
-                        distance = abs(point - entry_point)
-                        fee = distance * RATE
-                        total_fees.value += fee
-                        total_vehicles.value += 1
-                        response = f"Vehicle {plate} exited at point {point}. Fee: {fee}"
-                conn.sendall(response.encode())
-                logging.info(f"CLIENT EXIT: Plate {plate} exited at toll point {point} with fee collected {fee}.")
-            
-            else:
-                error_msg = "ERROR: Unknown transaction type"
-                conn.sendall(error_msg.encode())
-                logging.error(f"From {address}: {error_msg}")
-        except Exception as e:
-            error_msg = f"ERROR: {str(e)}"
-            conn.sendall(error_msg.encode())
-            logging.exception(f"Exception handling client {address}: {error_msg}")
-
-def stats_display(vehicles, total_vehicles, total_fees, stop_event):
+            while True:
+                received = conn.recv_into(view[filled:])
+                if not received:
+                    # A final message without a trailing newline is still processed
+                    # (the client may have only closed its sending side)
+                    data = bytes(view[:filled]).strip()
+                    if data and not discarding:
+                        process_message(
+                            conn, address, data, vehicles, locks, current_vehicles, total_vehicles, total_fees
+                        )
+                    break
+                filled += received
+
+                start = 0
+                if discarding:
+                    end = buf.find(b"\n", 0, filled)
+                    if end == -1:
+                        filled = 0
+                        continue
+                    discarding = False
+                    start = end + 1
+
+                end = buf.find(b"\n", start, filled)
+                while end != -1:
+                    data = bytes(view[start:end]).strip()
+                    if data:
+                        process_message(
+                            conn, address, data, vehicles, locks, current_vehicles, total_vehicles, total_fees
+                        )
+                    start = end + 1
+                    end = buf.find(b"\n", start, filled)
+
+                if start:
+                    # Keep any incomplete trailing message at the front of the buffer
+                    buf[:filled - start] = view[start:filled]
+                    filled -= start
+                elif filled == len(buf):
+                    send_response(conn, INVALID_FORMAT_RESPONSE)
+                    logging.error(f"From {address}: ERROR: Message exceeds {RECV_BUFFER_SIZE} bytes")
+                    discarding = True
+                    filled = 0
+        except socket.timeout:
+            # Reset instead of closing gracefully, so the server does not hold a
+            # TIME_WAIT socket for the connection; TollClient reconnects on its next send
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            logging.info(f"Closing idle connection from {address}.")
+        except OSError:
+            # The connection itself failed (e.g. reset by the client), so no reply can be sent
+            logging.exception(f"Connection error with client {address}")
+        except Exception:
+            # A bug in the server; log it without replying on a connection in an unknown state
+            logging.exception(f"Unexpected error handling client {address}")
+
+def stats_display(current_vehicles, total_vehicles, total_fees, stop_event):
     """
     Display highway statistics in real time every 5 seconds.
     Shows:
       - Current number of vehicles in the highway
       - Total number of vehicles that have used the highway
       - Total fees collected
+
+    Reads only the per-shard counters, never the vehicle dicts, and takes no
+    shard locks; the snapshot may be slightly stale, which is fine for display.
     """
-    setup_logging()
     while not stop_event.is_set():
-        current_count = len(vehicles)
-        stats_message = (f"Current vehicles in highway: {current_count} | "
-                         f"Total vehicles used highway: {total_vehicles.value} | "
-                         f"Total fees collected: {total_fees.value}")
-        logging.info(stats_message)
-        try:
-            time.sleep(5)
-        except KeyboardInterrupt:
-            break
-    logging.info("Stats display process terminating.")
+        logging.info(STATS_TEMPLATE, sum(current_vehicles), sum(total_vehicles), sum(total_fees))
+        stop_event.wait(5)
+    logging.info("Stats display thread terminating.")
 
 def main():
-    setup_logging()
+    log_listener = setup_logging()
     
     # Determine the port number from command-line argument or user input.
     if len(sys.argv) > 1:
@@ -142,50 +276,120 @@ def main():
     
     host = '0.0.0.0'
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.settimeout(1.0)  # Set timeout so accept() is not blocking indefinitely
+    server_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # Allow an immediate restart on the same port while old connections sit in TIME_WAIT.
+    # On Windows SO_REUSEADDR would also let another process steal the port, so it is skipped there.
+    if os.name != 'nt':
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_socket.bind((host, port))
-    server_socket.listen(10)
+    server_socket.listen(socket.SOMAXCONN)  # Large backlog so connection bursts are not dropped
     logging.info(f"Server listening on {host}:{port}")
     logging.info("Booting up. Press Ctrl+C to exit the server program.")
 
-    manager = multiprocessing.Manager()
-    vehicles = manager.dict()              # { plate: entry_point }
-    total_vehicles = manager.Value('i', 0)   # count of vehicles that have exited
-    total_fees = manager.Value('d', 0.0)     # total fees collected
-    lock = manager.Lock()
-    stop_event = manager.Event()           # Used to signal the stats_display process to stop
+    vehicles = tuple({} for _ in range(SHARDS))    # per shard: { plate: entry_point }
+    locks = tuple(threading.Lock() for _ in range(SHARDS))
+    current_vehicles = [0] * SHARDS        # per shard: count of vehicles currently in the highway
+    total_vehicles = [0] * SHARDS          # per shard: count of vehicles that have exited
+    total_fees = [0.0] * SHARDS            # per shard: total fees collected
+    stop_event = threading.Event()         # Used to signal the accept loop and stats_display thread to stop
 
-    # Start a separate process to display stats in real time
-    stats_process = multiprocessing.Process(
-        target=stats_display, args=(vehicles, total_vehicles, total_fees, stop_event)
+    # Start a separate thread to display stats in real time
+    stats_thread = threading.Thread(
+        target=stats_display, args=(current_vehicles, total_vehicles, total_fees, stop_event)
     )
-    stats_process.start()
+    stats_thread.start()
+
+    # Wait for new connections with the OS readiness API (epoll/kqueue) instead of polling.
+    # The read end of a socket pair is also watched so Ctrl+C, or a client handler
+    # finishing, can wake the loop immediately.
+    sel = selectors.DefaultSelector()
+    wakeup_recv, wakeup_send = socket.socketpair()
+    wakeup_send.setblocking(False)
+    server_socket.setblocking(False)
+    sel.register(server_socket, selectors.EVENT_READ)
+    sel.register(wakeup_recv, selectors.EVENT_READ)
+
+    def wake_accept_loop():
+        try:
+            wakeup_send.send(b"\0")
+        except BlockingIOError:
+            pass  # The loop already has a wakeup pending
+
+    def request_shutdown(signum, frame):
+        stop_event.set()
+
+    # The interpreter itself writes to the socket pair when a signal arrives, which
+    # also wakes select() on Windows, where a blocking select() ignores Ctrl+C
+    signal.set_wakeup_fd(wakeup_send.fileno(), warn_on_full_buffer=False)
+    signal.signal(signal.SIGINT, request_shutdown)
+
+    # Client connections are handled by a pool of worker threads. A connection is
+    # only accepted once a worker is free to take it; until then, new clients wait
+    # in the kernel's listen backlog instead of piling up inside the server.
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    worker_slots = threading.Semaphore(MAX_WORKERS)
+    accepting = True
+    # Open client connections, so idle persistent connections can be closed on shutdown
+    connections = set()
+
+    def release_worker(conn):
+        connections.discard(conn)
+        worker_slots.release()
+        wake_accept_loop()
 
-    # Keep track of client handler processes for a graceful shutdown
-    processes = []
     try:
-        while True:
-            try:
-                conn, address = server_socket.accept()
-            except socket.timeout:
-                continue
-            process = multiprocessing.Process(
-                target=handle_client,
-                args=(conn, address, vehicles, total_vehicles, total_fees, lock)
-            )
-            process.start()
-            processes.append(process)
-    except KeyboardInterrupt:
-        logging.info("KeyboardInterrupt detected. Server shutting down.")
+        while not stop_event.is_set():
+            for key, _ in sel.select():
+                if key.fileobj is wakeup_recv:
+                    wakeup_recv.recv(1024)
+                    if not accepting:
+                        sel.register(server_socket, selectors.EVENT_READ)
+                        accepting = True
+                elif not worker_slots.acquire(blocking=False):
+                    # Every worker is busy; stop watching for connections until one is released
+                    sel.unregister(server_socket)
+                    accepting = False
+                else:
+                    try:
+                        conn, address = server_socket.accept()
+                    except BlockingIOError:
+                        # The pending connection was dropped before it could be accepted
+                        worker_slots.release()
+                        continue
+                    except OSError:
+                        # E.g. the connection was aborted, or the process is out of file
+                        # descriptors; keep serving instead of shutting the server down
+                        worker_slots.release()
+                        logging.exception("Failed to accept a client connection")
+                        continue
+                    connections.add(conn)
+                    future = executor.submit(
+                        handle_client, conn, address,
+                        vehicles, locks, current_vehicles, total_vehicles, total_fees
+                    )
+                    future.add_done_callback(lambda _, conn=conn: release_worker(conn))
+        logging.info("Interrupt received. Server shutting down.")
     finally:
-        stop_event.set()  # Signal the stats display process to exit
+        # The shutdown handler needs the wakeup socket closed below; a further Ctrl+C
+        # now terminates the process immediately instead, in case shutdown hangs
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.set_wakeup_fd(-1)
+        stop_event.set()  # Signal the stats display thread to exit
+        sel.close()
         server_socket.close()
-        logging.info("Server socket closed. Waiting for child processes to finish.")
-        # Join all child processes
-        for process in processes:
-            process.join(timeout=5)
-        stats_process.join(timeout=5)
-        logging.info("All processes terminated. Exiting server.")
+        logging.info("Server socket closed. Waiting for client handlers to finish.")
+        # Unblock handlers still waiting on idle client connections
+        for conn in list(connections):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        executor.shutdown(wait=True)
+        wakeup_recv.close()
+        wakeup_send.close()
+        stats_thread.join(timeout=5)
+        logging.info("All threads terminated. Exiting server.")
+        log_listener.stop()  # Flush any queued log records
 
 if __name__ == "__main__":
     main()